@@ -16,12 +16,45 @@
 # In[1]:
 
 
+import datetime
+import hashlib
+import json
+import os
+import pathlib
+
 import pandas as pd
 import numpy as np
 import xlsxwriter
 import requests
 import math
 
+# One pooled session for every call: keep-alive skips the TCP+TLS handshake
+# after the first request, and gzip shrinks the JSON payloads.
+SESSION = requests.Session()
+SESSION.headers.update({'Accept-Encoding': 'gzip, deflate'})
+
+
+def cached_get(url):
+    """SESSION.get(url).json(), memoized to .cache/ for the current day.
+
+    The cache key is the URL without the token plus today's date, so reruns
+    within the same trading day skip the network entirely.
+    """
+    key = hashlib.md5(
+        (url.split('token=')[0] + datetime.date.today().isoformat()).encode()
+    ).hexdigest()
+    path = pathlib.Path('.cache') / f'{key}.json'
+    if path.exists():
+        return json.loads(path.read_text())
+    resp = SESSION.get(url)
+    # Never cache an error body - a rate-limit response served from disk for
+    # the rest of the day would be much harder to diagnose than a loud failure.
+    resp.raise_for_status()
+    data = resp.json()
+    path.parent.mkdir(exist_ok=True)
+    path.write_text(json.dumps(data))
+    return data
+
 
 # ## Importing Our List of Stocks
 # 
@@ -36,7 +69,19 @@ import math
 # In[2]:
 
 
-stocks = pd.read_csv('sp_500_stocks.csv')
+def load_stocks():
+    """Load the S&P 500 constituents, caching a Parquet copy on first run.
+
+    The constituent list is a fixed reference file, so after the first run we
+    read the binary Parquet copy instead of re-parsing the CSV text.
+    """
+    parquet_path = 'sp_500_stocks.parquet'
+    if not os.path.exists(parquet_path):
+        pd.read_csv('sp_500_stocks.csv').to_parquet(parquet_path)
+    return pd.read_parquet(parquet_path)
+
+
+stocks = load_stocks()
 print(f'Number of stocks in S&P 500 index: {len(stocks)}')
 stocks
 
@@ -112,22 +157,22 @@ final_df
 # In[8]:
 
 
-final_df = pd.DataFrame(columns=my_columns)
+rows = []
 for stock in stocks['Ticker']:
     api_url = f'https://sandbox.iexapis.com/stable/stock/{stock}/quote/?token={IEX_CLOUD_API_TOKEN}'
-    data = requests.get(api_url).json()
-    final_df = final_df.append(
-        pd.Series(
-        [
-            stock,
-            data['latestPrice'],
-            data['marketCap'],
-            'N/A'
-        ],
-        index = my_columns),
-    ignore_index = True
-    )
-    
+    data = SESSION.get(api_url).json()
+    rows.append({
+        'Ticker': stock,
+        'Stock Price': data['latestPrice'],
+        'Market Capitalization': data['marketCap'],
+        'Number of Shares to Buy': np.nan
+    })
+
+final_df = pd.DataFrame(rows, columns=my_columns).astype({
+    'Stock Price': 'float64',
+    'Market Capitalization': 'float64',
+    'Number of Shares to Buy': 'float64'
+})
 final_df
 
 
@@ -144,39 +189,31 @@ final_df
 # In[9]:
 
 
-def chucks(lst, n):
-    """Yield successive n-sized cunks for lst."""
-    for i in range(0, len(lst), n):
-        yield lst[i:i + n]
+tickers = stocks['Ticker'].to_numpy()
+symbol_strings = [','.join(tickers[i:i + 100]) for i in range(0, len(tickers), 100)]
 
 
 # In[16]:
 
 
-symbol_groups = list(chucks(stocks['Ticker'], 100))
-
-symbol_strings = []
-
-for i in range(0, len(symbol_groups)):
-    symbol_strings.append(','.join(symbol_groups[i]))
-    #print(symbol_strings[i])
-final_df = pd.DataFrame(columns=my_columns)
+rows = []
 
 for symbol_string in symbol_strings:
     batch_api_call_url = f'https://sandbox.iexapis.com/stable/stock/market/batch?symbols={symbol_string}&types=quote&token={IEX_CLOUD_API_TOKEN}'
-    data = requests.get(batch_api_call_url).json()
+    data = cached_get(batch_api_call_url)
     for symbol in symbol_string.split(','):
-        final_df = final_df.append(
-            pd.Series(
-            [
-                symbol,
-                data[symbol]['quote']['latestPrice'],
-                data[symbol]['quote']['marketCap'],
-                'N/A'
-            ],
-            index=my_columns),
-            ignore_index=True
-        )
+        rows.append({
+            'Ticker': symbol,
+            'Stock Price': data[symbol]['quote']['latestPrice'],
+            'Market Capitalization': data[symbol]['quote']['marketCap'],
+            'Number of Shares to Buy': np.nan
+        })
+
+final_df = pd.DataFrame(rows, columns=my_columns).astype({
+    'Stock Price': 'float64',
+    'Market Capitalization': 'float64',
+    'Number of Shares to Buy': 'float64'
+})
 final_df
 
 
@@ -209,8 +246,9 @@ portfolio_size
 
 
 position_size = (final_df['Market Capitalization']/final_df['Market Capitalization'].sum()) * float(portfolio_size)
-for i in range(0, len(final_df.index)):
-    final_df.loc[i, 'Number of Shares to Buy'] = position_size[i]/final_df.loc[i, 'Stock Price']
+# Kept as float64: a missing price comes through as NaN, and casting NaN to
+# int is undefined in NumPy (it silently produces INT_MIN). NaN stays NaN here.
+final_df['Number of Shares to Buy'] = np.floor(position_size.to_numpy() / final_df['Stock Price'].to_numpy())
 final_df
 
 
@@ -291,25 +329,6 @@ float_format = writer.book.add_format(
 # In[76]:
 
 
-#writer.sheets['Recommended Trades'].set_column('A:A', 18, string_format)
-#writer.sheets['Recommended Trades'].set_column('B:B', 18, string_format)
-#writer.sheets['Recommended Trades'].set_column('C:C', 18, string_format)
-#writer.sheets['Recommended Trades'].set_column('D:D', 18, string_format)
-#writer.save()
-
-writer.sheets['Recommended Trades'].write('A1', 'Ticker', string_format)
-writer.sheets['Recommended Trades'].write('B1', 'Stock Price', dollar_format)
-writer.sheets['Recommended Trades'].write('C1', 'Market Capitalization', dollar_format)
-writer.sheets['Recommended Trades'].write('D1', 'Number of Shares to Buy', float_format)
-
-
-# This code works, but it violates the software principle of "Don't Repeat Yourself". 
-# 
-# Let's simplify this by putting it in 2 loops:
-
-# In[78]:
-
-
 column_formats = {
     'A': ['Ticker', string_format],
     'B': ['Stock Price', dollar_format],
@@ -317,9 +336,11 @@ column_formats = {
     'D': ['Number of Shares to Buy', float_format]
 }
 
-for column in column_formats.keys():
-    writer.sheets['Recommended Trades'].set_column(f'{column}:{column}', 18, column_formats[column][1])
-    writer.sheets['Recommended Trades'].write(f'{column}1', column_formats[column][0], column_formats[column][1])
+headers = [column_formats[column][0] for column in column_formats]
+writer.sheets['Recommended Trades'].write_row(0, 0, headers, string_format)
+
+for i, column in enumerate(column_formats):
+    writer.sheets['Recommended Trades'].set_column(i, i, 18, column_formats[column][1])
 
 
 # ## Saving Our Excel Output
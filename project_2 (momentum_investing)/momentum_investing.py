@@ -9,19 +9,45 @@
 # 
 # 
 # ## Library Imports
-# 
+#
 # The first thing we need to do is import the open-source software libraries that we'll be using in this tutorial.
+#
+# Note that `httpx` needs its HTTP/2 extra for the concurrent batch calls below - install it with `pip install "httpx[http2]"` - and that the Parquet cache of the constituents list requires `pyarrow`.
 
 # In[1]:
 
 
+import asyncio
+import datetime
+import hashlib
+import json
+import os
+import pathlib
+
+import httpx
 import numpy as np
 import pandas as pd
 import requests
 import math
 from scipy import stats
 import xlsxwriter
-from scipy.stats import percentileofscore as score
+from scipy.stats import rankdata
+
+# One pooled session for the synchronous calls: keep-alive skips the TCP+TLS
+# handshake after the first request, and gzip shrinks the JSON payloads.
+SESSION = requests.Session()
+SESSION.headers.update({'Accept-Encoding': 'gzip, deflate'})
+
+
+def cache_path(url):
+    """Cache file for a URL: keyed on the URL without the token, plus today's date.
+
+    Reruns within the same trading day hit the local cache instead of the API.
+    """
+    key = hashlib.md5(
+        (url.split('token=')[0] + datetime.date.today().isoformat()).encode()
+    ).hexdigest()
+    return pathlib.Path('.cache') / f'{key}.json'
 
 
 # ## Importing Our List of Stocks
@@ -31,7 +57,19 @@ from scipy.stats import percentileofscore as score
 # In[2]:
 
 
-stocks = pd.read_csv('sp_500_stocks.csv')
+def load_stocks():
+    """Load the S&P 500 constituents, caching a Parquet copy on first run.
+
+    The constituent list is a fixed reference file, so after the first run we
+    read the binary Parquet copy instead of re-parsing the CSV text.
+    """
+    parquet_path = 'sp_500_stocks.parquet'
+    if not os.path.exists(parquet_path):
+        pd.read_csv('sp_500_stocks.csv').to_parquet(parquet_path)
+    return pd.read_parquet(parquet_path)
+
+
+stocks = load_stocks()
 from secrets import IEX_CLOUD_API_TOKEN
 
 
@@ -46,7 +84,7 @@ from secrets import IEX_CLOUD_API_TOKEN
 
 symbol = 'AAPL'
 api_url = f'https://sandbox.iexapis.com/stable/stock/{symbol}/stats?token={IEX_CLOUD_API_TOKEN}'
-data = requests.get(api_url).json()
+data = SESSION.get(api_url).json()
 
 
 # ## Parsing Our API Call
@@ -63,49 +101,69 @@ data['year1ChangePercent']
 # 
 # Just like in our first project, it's now time to execute several batch API calls and add the information we need to our DataFrame.
 # 
-# We'll start by running the following code cell, which contains some code we already built last time that we can re-use for this project. More specifically, it contains a function called `chunks` that we can use to divide our list of securities into groups of 100.
+# We'll start by running the following code cell, which slices the ticker list into groups of 100 and joins each group into one comma-separated string for the batch endpoint.
 
 # In[5]:
 
 
-# Function sourced from 
-# https://stackoverflow.com/questions/312443/how-do-you-split-a-list-into-evenly-sized-chunks
-def chunks(lst, n):
-    """Yield successive n-sized chunks from lst."""
-    for i in range(0, len(lst), n):
-        yield lst[i:i + n]   
-        
-symbol_groups = list(chunks(stocks['Ticker'], 100))
-symbol_strings = []
-for i in range(0, len(symbol_groups)):
-    symbol_strings.append(','.join(symbol_groups[i]))
-    print(symbol_strings[i])
+tickers = stocks['Ticker'].to_numpy()
+symbol_strings = [','.join(tickers[i:i + 100]) for i in range(0, len(tickers), 100)]
 
 my_columns = ['Ticker', 'Price', 'One-Year Price Return', 'Number of Shares to Buy']
 
+batch_urls = [
+    f'https://sandbox.iexapis.com/stable/stock/market/batch?symbols={symbol_string}&types=price,stats&token={IEX_CLOUD_API_TOKEN}'
+    for symbol_string in symbol_strings
+]
+
 
-# Now we need to create a blank DataFrame and add our data to the data frame one-by-one.
+# The batch calls are independent of each other and the script spends almost all of its time waiting on the network, so we'll fire them all concurrently with `asyncio` and `httpx`. With HTTP/2 enabled they are multiplexed over a single TCP+TLS connection - one handshake and roughly one round trip of waiting for the whole batch.
 
 # In[6]:
 
 
-final_df = pd.DataFrame(columns=my_columns)
+async def fetch(client, url):
+    path = cache_path(url)
+    if path.exists():
+        return json.loads(path.read_text())
+    resp = await client.get(url)
+    # Never cache an error body - a rate-limit response served from disk for
+    # the rest of the day would be much harder to diagnose than a loud failure.
+    resp.raise_for_status()
+    data = resp.json()
+    path.parent.mkdir(exist_ok=True)
+    path.write_text(json.dumps(data))
+    return data
+
+
+async def fetch_all(urls):
+    async with httpx.AsyncClient(http2=True, timeout=10.0) as client:
+        return await asyncio.gather(*(fetch(client, url) for url in urls))
 
-for symbol_string in symbol_strings:
-    batch_api_call_url = f'https://sandbox.iexapis.com/stable/stock/market/batch?symbols={symbol_string}&types=price,stats&token={IEX_CLOUD_API_TOKEN}'
-    data = requests.get(batch_api_call_url).json()
+
+# Now we need to create a blank DataFrame and add our data to the data frame one-by-one. We keep the raw batch responses around in `batch_data` - they already contain the price and every return period we need, so one fetch feeds both this DataFrame and the high-quality-momentum one further down.
+
+# In[7]:
+
+
+batch_data = asyncio.run(fetch_all(batch_urls))
+
+rows = []
+
+for symbol_string, data in zip(symbol_strings, batch_data):
     for symbol in symbol_string.split(','):
-        final_df = final_df.append(
-        pd.Series(
-        [
-            symbol,
-            data[symbol]['price'],
-            data[symbol]['stats']['year1ChangePercent'],
-            'N/A'
-        ],
-        index = my_columns),
-            ignore_index=True
-        )
+        rows.append({
+            'Ticker': symbol,
+            'Price': data[symbol]['price'],
+            'One-Year Price Return': data[symbol]['stats']['year1ChangePercent'],
+            'Number of Shares to Buy': np.nan
+        })
+
+final_df = pd.DataFrame(rows, columns=my_columns).astype({
+    'Price': 'float64',
+    'One-Year Price Return': 'float64',
+    'Number of Shares to Buy': 'float64'
+})
 final_df
 
 
@@ -113,15 +171,13 @@ final_df
 # 
 # The investment strategy that we're building seeks to identify the 50 highest-momentum stocks in the S&P 500.
 # 
-# Because of this, the next thing we need to do is remove all the stocks in our DataFrame that fall below this momentum threshold. We'll sort the DataFrame by the stocks' one-year price return, and drop all stocks outside the top 50.
+# Because of this, the next thing we need to do is remove all the stocks in our DataFrame that fall below this momentum threshold. `nlargest` keeps the 50 highest one-year returns with a partial sort - we only ever need the top 50, not a full ordering of all 500 rows.
 # 
 
 # In[7]:
 
 
-final_df.sort_values('One-Year Price Return', ascending=False, inplace=True)
-final_df = final_df.head(50)
-final_df.reset_index(inplace=True)
+final_df = final_df.nlargest(50, 'One-Year Price Return').reset_index(drop=True)
 final_df
 
 
@@ -135,26 +191,26 @@ final_df
 
 
 def portfolio_input():
-    global portfolio_size
-    portfolio_size = input("Enter the value of your portfolio:")
+    """Prompt for the portfolio value until a valid number is entered."""
+    while True:
+        try:
+            return float(input("Enter the value of your portfolio:"))
+        except ValueError:
+            print("That's not a number! \n Try again:")
 
-    try:
-        val = float(portfolio_size)
-    except ValueError:
-        print("That's not a number! \n Try again:")
-        portfolio_size = input("Enter the value of your portfolio:")
 
-portfolio_input()
+portfolio_size = portfolio_input()
 print(portfolio_size)
 
 
 # In[ ]:
 
 
-position_size = float(portfolio_size)/len(final_df.index)
-for i in range(0, len(final_df)):
-    final_df.loc[i, 'Number of Shares to Buy'] = position_size/final_df.loc[i, 'Price']
-    
+position_size = portfolio_size/len(final_df.index)
+# Kept as float64: a missing price comes through as NaN, and casting NaN to
+# int is undefined in NumPy (it silently produces INT_MIN). NaN stays NaN here.
+final_df['Number of Shares to Buy'] = np.floor(position_size / final_df['Price'].to_numpy())
+
 final_df
 
 
@@ -193,35 +249,36 @@ hqm_columns = [
     'One-Month Return Percentile'
 ]
 
-hqm_df= pd.DataFrame(columns=hqm_columns)
-
-
 # In[ ]:
 
 
-for symbol_string in symbol_strings:
-    batch_api_call_url = f'https://sandbox.iexapis.com/stable/stock/market/batch?symbols={symbol_string}&types=price,stats&token={IEX_CLOUD_API_TOKEN}'
-    data = requests.get(batch_api_call_url).json()
+hqm_rows = []
+
+for symbol_string, data in zip(symbol_strings, batch_data):
     for symbol in symbol_string.split(','):
-        hqm_df = hqm_df.append(
-        pd.Series(
-        [
-            symbol,
-            data[symbol]['price'],
-            'N/A',
-            data[symbol]['stats']['year1ChangePercent'],
-            'N/A',
-            data[symbol]['stats']['month6ChangePercent'],
-            'N/A',
-            data[symbol]['stats']['month3ChangePercent'],
-            'N/A',
-            data[symbol]['stats']['month1ChangePercent'],
-            'N/A'  
-        ],
-        index=hqm_columns),
-        ignore_index=True
-    )
-        
+        hqm_rows.append({
+            'Ticker': symbol,
+            'Price': data[symbol]['price'],
+            'Number of Shares to Buy': np.nan,
+            'One-Year Price Return': data[symbol]['stats']['year1ChangePercent'],
+            'One-Year Return Percentile': np.nan,
+            'Six-Month Price Return': data[symbol]['stats']['month6ChangePercent'],
+            'Six-Month Return Percentile': np.nan,
+            'Three-Month Price Return': data[symbol]['stats']['month3ChangePercent'],
+            'Three-Month Return Percentile': np.nan,
+            'One-Month Price Return': data[symbol]['stats']['month1ChangePercent'],
+            'One-Month Return Percentile': np.nan
+        })
+
+hqm_df = pd.DataFrame(hqm_rows, columns=hqm_columns)
+
+# Everything except the ticker is numeric - coercing to float64 up front keeps
+# the columns out of object dtype, so the percentile and mean passes below run
+# on contiguous buffers instead of boxed Python objects. errors='coerce' folds
+# None or any non-numeric stray from the sandbox API into NaN instead of
+# raising, and the fillna pass below turns those NaNs into 0.0.
+float_cols = [column for column in hqm_columns if column != 'Ticker']
+hqm_df[float_cols] = hqm_df[float_cols].apply(pd.to_numeric, errors='coerce')
 hqm_df
 
 
@@ -249,28 +306,25 @@ time_periods = ['One-Year',
 # In[ ]:
 
 
-for row in hqm_df.index:
-    for time_period in time_periods:
-    
-        change_col = f'{time_period} Price Return'
-        percentile_col = f'{time_period} Return Percentile'
-        if hqm_df.loc[row, change_col] == None:
-            hqm_df.loc[row, change_col] = 0.0
-            
-# This link here; https://stackoverflow.com/questions/65174575/typeerror-not-supported-between-instances-of-nonetype-and-float
-# Helped to solve the issue of 'TypeError: '<' not supported between instances of 'NoneType' and 'float'
+change_cols = [f'{time_period} Price Return' for time_period in time_periods]
+hqm_df[change_cols] = hqm_df[change_cols].fillna(0.0)
+
+# The sandbox API sometimes returns None for a price return, which used to
+# break the percentile comparisons ('TypeError: '<' not supported between
+# instances of 'NoneType' and 'float'). The coercing cast at construction
+# already folded those into NaN; one fillna pass over all four columns turns
+# them into 0.0 before the rank pass.
 
 
 # In[ ]:
 
 
-for row in hqm_df.index:
-    for time_period in time_periods:
-    
-        change_col = f'{time_period} Price Return'
-        percentile_col = f'{time_period} Return Percentile'
+for time_period in time_periods:
+    change_col = f'{time_period} Price Return'
+    percentile_col = f'{time_period} Return Percentile'
 
-        hqm_df.loc[row, percentile_col] = score(hqm_df[change_col], hqm_df.loc[row, change_col])/100
+    vals = hqm_df[change_col].to_numpy(dtype=np.float64)
+    hqm_df[percentile_col] = rankdata(vals, method='average') / len(vals)
 
 
 # In[ ]:
@@ -285,32 +339,25 @@ hqm_df
 # 
 # The `HQM Score` will be the arithmetic mean of the 4 momentum percentile scores that we calculated in the last section.
 # 
-# To calculate arithmetic mean, we will use the `mean` function from Python's built-in `statistics` module.
+# To calculate arithmetic mean, we take a single row-wise `mean` over the four percentile columns - one NumPy reduction instead of a Python loop per stock.
 
 # In[ ]:
 
 
-from statistics import mean
+pct_cols = [f'{time_period} Return Percentile' for time_period in time_periods]
+hqm_df['HQM Score'] = hqm_df[pct_cols].to_numpy(dtype=np.float64).mean(axis=1)
 
-for row in hqm_df.index:
-    momentum_percentiles = []
-    for time_period in time_periods:
-        momentum_percentiles.append(hqm_df.loc[row, f'{time_period} Return Percentile'])
-    hqm_df.loc[row, 'HQM Score'] = mean(momentum_percentiles)
-    
 hqm_df
 
 
 # ## Selecting the 50 Best Momentum Stocks
 # 
-# As before, we can identify the 50 best momentum stocks in our universe by sorting the DataFrame on the `HQM Score` column and dropping all but the top 50 entries.
+# As before, we can identify the 50 best momentum stocks in our universe by taking the 50 largest `HQM Score` entries with `nlargest`.
 
 # In[ ]:
 
 
-hqm_df.sort_values('HQM Score', ascending=False, inplace=True)
-hqm_df = hqm_df[:50]
-hqm_df.reset_index(drop=True, inplace=True)
+hqm_df = hqm_df.nlargest(50, 'HQM Score').reset_index(drop=True)
 hqm_df
 
 
@@ -321,15 +368,15 @@ hqm_df
 # In[ ]:
 
 
-portfolio_input()
+portfolio_size = portfolio_input()
 
 
 # In[ ]:
 
 
-position_size = float(portfolio_size)/len(hqm_df.index)
-for i in hqm_df.index:
-    hqm_df.loc[i, 'Number of Shares to Buy'] = position_size/hqm_df.loc[i, 'Price']
+position_size = portfolio_size/len(hqm_df.index)
+# Float64 on purpose - see the note on final_df's shares column above.
+hqm_df['Number of Shares to Buy'] = np.floor(position_size / hqm_df['Price'].to_numpy())
 
 hqm_df
 
@@ -412,22 +459,25 @@ float_template = writer.book.add_format(
 # In[ ]:
 
 
-column_formats = {    
-    'A': ['Ticker', string_template],
-    'B': ['Price', dollar_template],
-    'C': ['Number of Shares to Buy', float_template],
-    'D': ['One-Year Price Return', percent_template],
-    'E': ['One-Year Return Percentile', percent_template],
-    'F': ['Six-Month Price Return', percent_template],
-    'G': ['Six-Month Return Percentile', percent_template],
-    'H': ['Three-Month Price Return', percent_template],
-    'J': ['Three-Month Return Percentile', percent_template],
-    'K': ['One-Month Price Return', percent_template],
-    'L': ['One-Month Return Percentile', percent_template]}
-
-for column in column_formats.keys():
-    writer.sheets['Momentum Strategy'].set_column(f'{column}:{column}', 22, column_formats[column][1])
-    writer.sheets['Momentum Strategy'].write(f'{column}1', column_formats[column][0], column_formats[column][1])
+column_formats = [
+    ['Ticker', string_template],
+    ['Price', dollar_template],
+    ['Number of Shares to Buy', float_template],
+    ['One-Year Price Return', percent_template],
+    ['One-Year Return Percentile', percent_template],
+    ['Six-Month Price Return', percent_template],
+    ['Six-Month Return Percentile', percent_template],
+    ['Three-Month Price Return', percent_template],
+    ['Three-Month Return Percentile', percent_template],
+    ['One-Month Price Return', percent_template],
+    ['One-Month Return Percentile', percent_template],
+    ['HQM Score', percent_template]]
+
+headers = [header for header, _ in column_formats]
+writer.sheets['Momentum Strategy'].write_row(0, 0, headers, string_template)
+
+for i, (_, column_format) in enumerate(column_formats):
+    writer.sheets['Momentum Strategy'].set_column(i, i, 22, column_format)
 
 
 # ## Saving Our Excel Output